@@ -1,285 +1,292 @@
 from __future__ import annotations
 
+import asyncio
 import csv
+import heapq
+import json
+import queue
+import re
+import shutil
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from operator import itemgetter
 from pathlib import Path
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import StaleElementReferenceException
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import Select, WebDriverWait
+import aiohttp
+import lxml.html
 
 # === Ayarlar ===
 site_url = "https://obs.itu.edu.tr/public/DersProgram"
 
+# Sayfadaki formun arka planda çağırdığı uç noktalar
+brans_kodu_url = f"{site_url}/SearchBransKoduByProgramSeviye"
+ders_program_url = f"{site_url}/DersProgramSearch"
+
+# Çekilecek program seviyeleri (LS: Lisans)
+program_seviyeleri = ["LS"]
+
 excluded_codes: list[str] = []
+EXCLUDED = frozenset(excluded_codes)
 
-# Çekim için Chrome instance sayısı
-WORKER_COUNT = 5
+# OBS'e aynı anda atılan en fazla istek sayısı
+CONCURRENCY = 50
+
+# Başarısız bir istek için en fazla deneme sayısı (beklemeler 1, 2, 4, ... sn)
+MAX_ATTEMPTS = 5
 
 # Çıktı klasörü
 DATA_DIR = Path(__file__).resolve().parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 CSV_PATH = DATA_DIR / "program.csv"
+# Çekim sırasında her ders kodunun kayıtlarının yazıldığı ara dosyalar
+SHARD_DIR = DATA_DIR / "shards"
+
+FIELDNAMES = [
+    "Kod",
+    "Ders",
+    "Öğretim Yöntemi",
+    "Eğitmen",
+    "Gün",
+    "Saat",
+    "Bina",
+    "Kayıtlı",
+    "Kontenjan",
+    "Bölüm Sınırlaması",
+    "CRN",
+]
+# dict kaydı FIELDNAMES sırasında tuple'a çevirir
+_AS_ROW = itemgetter(*FIELDNAMES)
+# Ara dosyalardaki satırları (Kod, CRN) ile sıralar
+_ROW_SORT_KEY = itemgetter(FIELDNAMES.index("Kod"), FIELDNAMES.index("CRN"))
+
+# (ara dosya yolu, kayıtlar) çiftleri; None yazıcı thread'ine bitişi bildirir
+ShardQueue = queue.Queue[tuple[Path, list[dict[str, str]]] | None]
+
+_WHITESPACE = re.compile(r"\s+")
+_NL = re.compile(r"\s*\n\s*")
+
+# OBS'teki öğretim yöntemi -> CSV'deki kısa karşılığı
+_YONTEM_MAP = {
+    "Fiziksel (Yüz yüze)": "Fiziksel",
+    "Sanal (Çevrimiçi/Online)": "Online",
+}
 
 
 # === Ortak yardımcılar ===
 def clean_text(text: str) -> str:
-    return text.strip().replace("\n", " / ")
-
-
-def create_driver() -> tuple[webdriver.Chrome, WebDriverWait]:
-    """Yeni bir headless Chrome driver + WebDriverWait döner."""
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--window-size=1920,1080")
-    driver = webdriver.Chrome(service=Service(), options=chrome_options)
-    wait = WebDriverWait(driver, 12)
-    return driver, wait
-
-
-def select_course_code(
-    driver: webdriver.Chrome,
-    wait: WebDriverWait,
-    ders_kodu: str,
-    retries: int = 3,
-) -> bool:
-    """Dropdown'dan ders kodu seçer (stale retry ile)."""
-    for _ in range(retries):
-        try:
-            ders_select_element = wait.until(
-                EC.presence_of_element_located((By.ID, "dersBransKoduId"))
-            )
-            ders_select = Select(ders_select_element)
-            ders_select.select_by_visible_text(ders_kodu)
-            return True
-        except StaleElementReferenceException:
-            time.sleep(0.3)
-    return False
-
-
-def collect_course_entries(
-    driver: webdriver.Chrome,
-    wait: WebDriverWait,
-    ders_kodu: str,
-    retries: int = 3,
-) -> list[dict[str, str]]:
-    """Seçili ders kodu için tabloyu okuyup satırları dict listesine çevirir."""
-    for _ in range(retries):
-        try:
-            table = wait.until(EC.presence_of_element_located((By.TAG_NAME, "table")))
-            rows = table.find_elements(By.TAG_NAME, "tr")
-            entries: list[dict[str, str]] = []
-            for row in rows[1:]:  # İlk satır başlık
-                try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
-                except StaleElementReferenceException:
-                    raise
-                if len(cells) < 14:
+    return _NL.sub(" / ", text.strip())
+
+
+def cell_text(cell: lxml.html.HtmlElement) -> str:
+    """Hücre metnini tarayıcıdaki gibi döner (boşluklar sadeleşir, <br> satır sonu olur)."""
+    for node in cell.iter():
+        if node.text:
+            node.text = _WHITESPACE.sub(" ", node.text)
+        if node is not cell and node.tail:
+            node.tail = _WHITESPACE.sub(" ", node.tail)
+        if node.tag == "br":
+            node.tail = "\n" + (node.tail or "")
+    lines = (line.strip() for line in cell.text_content().split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def write_shard(path: Path, entries: list[dict[str, str]]) -> None:
+    """Kayıtları (Kod, CRN) sırasına göre sıralayıp ara CSV dosyasına yazar."""
+    entries.sort(key=itemgetter("Kod", "CRN"))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(map(_AS_ROW, entries))
+
+
+def merge_shards(shard_paths: list[Path], out_path: Path) -> int:
+    """Sıralı ara dosyaları tek geçişte birleştirip CSV'ye yazar, kayıt sayısını döner.
+
+    Aynı CRN birden fazla kez gelirse yalnızca ilki yazılır.
+    """
+    crn_index = FIELDNAMES.index("CRN")
+    seen: set[str] = set()
+    with ExitStack() as stack:
+        readers = [
+            csv.reader(stack.enter_context(open(p, newline="", encoding="utf-8")))
+            for p in shard_paths
+        ]
+        with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            for row in heapq.merge(*readers, key=_ROW_SORT_KEY):
+                crn = row[crn_index]
+                if crn in seen:
                     continue
+                seen.add(crn)
+                writer.writerow(row)
+    return len(seen)
 
-                ogretim_yontemi = clean_text(cells[3].text)
-                if ogretim_yontemi == "Fiziksel (Yüz yüze)":
-                    ogretim_yontemi = "Fiziksel"
-                elif ogretim_yontemi == "Sanal (Çevrimiçi/Online)":
-                    ogretim_yontemi = "Online"
-
-                ders_entry = {
-                    "Kod": clean_text(cells[1].text),
-                    "Ders": clean_text(cells[2].text),
-                    "Öğretim Yöntemi": ogretim_yontemi,
-                    "Eğitmen": clean_text(cells[4].text),
-                    "Gün": clean_text(cells[6].text),
-                    "Saat": clean_text(cells[7].text),
-                    "Bina": f"{clean_text(cells[5].text)} / {clean_text(cells[8].text)}",
-                    "Kayıtlı": clean_text(cells[10].text),
-                    "Kontenjan": clean_text(cells[9].text),
-                    "Bölüm Sınırlaması": clean_text(cells[12].text),
-                    "CRN": clean_text(cells[0].text),
-                }
-
-                ders_full_kod = ders_entry["Kod"]
-                if ders_full_kod in excluded_codes:
-                    continue  # Excluded ise atla
-
-                entries.append(ders_entry)
-            return entries
-        except StaleElementReferenceException:
-            time.sleep(0.4)
-    print(f"Stale element hatası (tablo okunamadı): {ders_kodu}")
-    return []
-
-
-def get_all_course_codes() -> list[str]:
-    """OBS sayfasından tüm dersBransKodu seçeneklerini çeker (tek driver ile)."""
-    driver, wait = create_driver()
-    try:
-        driver.get(site_url)
-        time.sleep(2)
 
-        # Lisans seçimi sadece 1 kere yapılır
-        lisans_select = wait.until(
-            EC.presence_of_element_located((By.ID, "programSeviyeTipiId"))
-        )
-        driver.execute_script("arguments[0].value = 'LS';", lisans_select)
-        driver.execute_script(
-            "arguments[0].dispatchEvent(new Event('change'))", lisans_select
-        )
-        time.sleep(1)
+def writer_loop(shard_queue: ShardQueue) -> None:
+    """Kuyruktan gelen kayıtları None gelene kadar ara dosyalara yazar."""
+    while True:
+        item = shard_queue.get()
+        if item is None:
+            return
+        write_shard(*item)
 
-        ders_select_element = wait.until(
-            EC.presence_of_element_located((By.ID, "dersBransKoduId"))
-        )
-        ders_select = Select(ders_select_element)
-        ders_kodlari = [
-            option.text.strip()
-            for option in ders_select.options
-            if option.get_attribute("value")
-        ]
-        return ders_kodlari
-    finally:
-        driver.quit()
 
+def create_session() -> aiohttp.ClientSession:
+    """OBS'e istek atacak yeni bir aiohttp oturumu döner."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=CONCURRENCY, ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=15),
+        headers={"X-Requested-With": "XMLHttpRequest"},
+    )
 
-def scrape_chunk(chunk: list[str]) -> list[dict[str, str]]:
-    """Verilen ders kodu listesi için tek Chrome instance'ı ile veri çeker."""
-    if not chunk:
-        return []
 
-    driver, wait = create_driver()
+def collect_course_entries(html: str, ders_kodu: str) -> list[dict[str, str]]:
+    """Ders kodu için dönen tabloyu okuyup satırları dict listesine çevirir."""
+    tree = lxml.html.fromstring(html)
+    rows = tree.xpath("//table//tr")
     entries: list[dict[str, str]] = []
-    try:
-        driver.get(site_url)
-        time.sleep(2)
-
-        # Lisans seçimi
-        lisans_select = wait.until(
-            EC.presence_of_element_located((By.ID, "programSeviyeTipiId"))
-        )
-        driver.execute_script("arguments[0].value = 'LS';", lisans_select)
-        driver.execute_script(
-            "arguments[0].dispatchEvent(new Event('change'))", lisans_select
-        )
-        time.sleep(1)
-
-        for ders_kodu in chunk:
-            try:
-                # Her seçim öncesi yeniden çekiyoruz (stale retry)
-                if not select_course_code(driver, wait, ders_kodu):
-                    print(
-                        f"[worker] Stale element hatası (ders kodu seçilemedi): {ders_kodu}"
-                    )
-                    continue
-                time.sleep(0.4)
-
-                # Göster butonuna bas
-                for _ in range(3):
-                    try:
-                        goster_buton = driver.find_element(
-                            By.CSS_SELECTOR, "button.btn-primary"
-                        )
-                        goster_buton.click()
-                        break
-                    except StaleElementReferenceException:
-                        time.sleep(0.3)
-                else:
-                    print(f"[worker] Stale element hatası (göster butonu): {ders_kodu}")
-                    continue
+    for row in rows[1:]:  # İlk satır başlık
+        cells = [clean_text(cell_text(td)) for td in row.xpath("./td")]
+        if len(cells) < 14:
+            continue
+
+        ders_entry = {
+            "Kod": cells[1],
+            "Ders": cells[2],
+            "Öğretim Yöntemi": _YONTEM_MAP.get(cells[3], cells[3]),
+            "Eğitmen": cells[4],
+            "Gün": cells[6],
+            "Saat": cells[7],
+            "Bina": f"{cells[5]} / {cells[8]}",
+            "Kayıtlı": cells[10],
+            "Kontenjan": cells[9],
+            "Bölüm Sınırlaması": cells[12],
+            "CRN": cells[0],
+        }
+
+        ders_full_kod = ders_entry["Kod"]
+        if ders_full_kod in EXCLUDED:
+            continue  # Excluded ise atla
+
+        entries.append(ders_entry)
+    return entries
 
-                # Tabloyu bekle
-                time.sleep(0.4)
-                ders_entries = collect_course_entries(driver, wait, ders_kodu)
-                if not ders_entries:
-                    continue
-                entries.extend(ders_entries)
 
-                print(f"[worker] Çekildi: {ders_kodu}")
-            except Exception as e:  # noqa: PERF203
-                print(f"[worker] Hata: {ders_kodu} ({e})")
+async def fetch_text(
+    session: aiohttp.ClientSession, url: str, params: dict[str, str]
+) -> str:
+    """GET isteği atar; bağlantı hatası ve 5xx yanıtlarda üstel bekleme ile tekrar dener."""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            async with session.get(url, params=params) as resp:
+                resp.raise_for_status()
+                return await resp.text()
+        except aiohttp.ClientResponseError as e:
+            if e.status < 500 or attempt == MAX_ATTEMPTS - 1:
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+        await asyncio.sleep(2**attempt)
+    raise AssertionError("unreachable")
+
+
+async def get_all_course_codes(
+    session: aiohttp.ClientSession, seviye: str
+) -> dict[str, str]:
+    """Program seviyesinin tüm ders branş kodlarını çeker (ders kodu -> dersBransKoduId)."""
+    items = json.loads(
+        await fetch_text(session, brans_kodu_url, {"programSeviyeTipiAnahtari": seviye})
+    )
+    return {
+        str(item["dersBransKodu"]).strip(): str(item["bransKoduId"])
+        for item in items
+        if item.get("bransKoduId")
+    }
+
+
+async def fetch_code(
+    session: aiohttp.ClientSession,
+    sem: asyncio.Semaphore,
+    shard_queue: ShardQueue,
+    seviye: str,
+    ders_kodu: str,
+    brans_kodu_id: str,
+) -> Path | None:
+    """Tek bir ders kodunun tablosunu çekip yazılmak üzere kuyruğa koyar, ara dosya yolunu döner."""
+    async with sem:
+        try:
+            html = await fetch_text(
+                session,
+                ders_program_url,
+                {
+                    "ProgramSeviyeTipiAnahtari": seviye,
+                    "dersBransKoduId": brans_kodu_id,
+                },
+            )
+        except Exception as e:
+            print(f"[fetch] Hata: {ders_kodu} ({e})")
+            return None
+
+    ders_entries = collect_course_entries(html, ders_kodu)
+    if not ders_entries:
+        return None
+    shard_path = SHARD_DIR / f"shard-{seviye}-{brans_kodu_id}.csv"
+    shard_queue.put((shard_path, ders_entries))
+    print(f"[fetch] Çekildi: {ders_kodu}")
+    return shard_path
+
+
+async def scrape_all(shard_queue: ShardQueue) -> list[Path]:
+    """Her program seviyesinin ders kodlarını bulur ve hepsini eş zamanlı olarak çeker.
+
+    Tüm seviyeler aynı oturumu (ve bağlantı havuzunu) paylaşır.
+    """
+    shard_paths: list[Path] = []
+    async with create_session() as session:
+        SHARD_DIR.mkdir(exist_ok=True)
+        sem = asyncio.Semaphore(CONCURRENCY)
+        for seviye in program_seviyeleri:
+            ders_kodlari = await get_all_course_codes(session, seviye)
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [{seviye}] {len(ders_kodlari)} ders kodu bulundu. Çekilmeye başlanıyor.")
+            if not ders_kodlari:
+                print(f"[{seviye}] Hiç ders kodu bulunamadı.")
                 continue
-    finally:
-        driver.quit()
 
-    return entries
+            results = await asyncio.gather(
+                *(
+                    fetch_code(
+                        session, sem, shard_queue, seviye, ders_kodu, brans_kodu_id
+                    )
+                    for ders_kodu, brans_kodu_id in ders_kodlari.items()
+                )
+            )
+            shard_paths.extend(path for path in results if path is not None)
+
+    return shard_paths
 
 
 def main() -> None:
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Veri toplama başlıyor...")
 
-    ders_kodlari = get_all_course_codes()
-    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {len(ders_kodlari)} ders kodu bulundu. Çekilmeye başlanıyor.")
-
-    all_entries: list[dict[str, str]] = []
-
-    if not ders_kodlari:
-        print("Hiç ders kodu bulunamadı.")
-    elif WORKER_COUNT <= 1:
-        # Tek worker (eski davranışa yakın)
-        all_entries = scrape_chunk(ders_kodlari)
-    else:
-        # Ders kodlarını WORKER_COUNT sayıda parçaya böl
-        worker_count = min(WORKER_COUNT, len(ders_kodlari))
-        chunks: list[list[str]] = [[] for _ in range(worker_count)]
-        for idx, kod in enumerate(ders_kodlari):
-            chunks[idx % worker_count].append(kod)
-
-        print(
-            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Paralel çekim başlıyor: {worker_count} worker, "
-            + ", ".join(str(len(c)) for c in chunks)
-            + " ders kodu / worker"
-        )
-
-        with ThreadPoolExecutor(max_workers=worker_count) as executor:
-            future_to_idx = {
-                executor.submit(scrape_chunk, chunk): i
-                for i, chunk in enumerate(chunks)
-                if chunk
-            }
-            for future in as_completed(future_to_idx):
-                i = future_to_idx[future]
-                try:
-                    result = future.result()
-                    all_entries.extend(result)
-                    print(
-                        f"[worker-{i}] Tamamlandı, {len(result)} kayıt eklendi "
-                        f"(toplam şu an: {len(all_entries)})"
-                    )
-                except Exception as e:  # noqa: PERF203
-                    print(f"[worker-{i}] Hata: {e}")
+    # Ara dosyalar, event loop'u bloklamamak için ayrı bir thread'de yazılır
+    shard_queue: ShardQueue = queue.Queue()
+    writer_thread = threading.Thread(target=writer_loop, args=(shard_queue,))
+    writer_thread.start()
+    try:
+        shard_paths = asyncio.run(scrape_all(shard_queue))
+    finally:
+        shard_queue.put(None)
+        writer_thread.join()
 
     # === Verileri CSV dosyasına yazıyor ===
-    if all_entries:
+    if shard_paths:
         # Kod'a göre alfabetik sırala (AKM, ALM, ... şeklinde)
-        all_entries.sort(key=lambda e: (e.get("Kod", ""), e.get("CRN", "")))
-
-        with open(CSV_PATH, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=[
-                    "Kod",
-                    "Ders",
-                    "Öğretim Yöntemi",
-                    "Eğitmen",
-                    "Gün",
-                    "Saat",
-                    "Bina",
-                    "Kayıtlı",
-                    "Kontenjan",
-                    "Bölüm Sınırlaması",
-                    "CRN",
-                ],
-            )
-            writer.writeheader()
-            writer.writerows(all_entries)
+        count = merge_shards(shard_paths, CSV_PATH)
+        shutil.rmtree(SHARD_DIR)
 
         print(
-            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] İşlem tamamlandı! {len(all_entries)} ders kaydı "
+            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] İşlem tamamlandı! {count} ders kaydı "
             f"'{CSV_PATH}' dosyasına kaydedildi."
         )
         print(f"Dosya yolu: {CSV_PATH}")
@@ -289,4 +296,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-